@@ -1,24 +1,44 @@
-import os, httpx, json
+import os, time, asyncio, argparse, statistics
+import httpx
 from dotenv import load_dotenv
 
 # Load .env so your API key is available
 load_dotenv()
 
-# Make a simple test request to OpenAI API
-r = httpx.post(
-    "https://api.openai.com/v1/chat/completions",
-    headers={"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"},
-    json={
-        "model": os.getenv("OPENAI_MODEL", "gpt-5-mini"),
-        "messages": [
-            {"role": "system", "content": "You are terse."},
-            {"role": "user", "content": "Say ok."}
-        ],
-        "max_completion_tokens": 5  # ✅ correct param for GPT-5
-    },
-    timeout=20
-)
+URL = "https://api.openai.com/v1/chat/completions"
+BODY = {
+    "model": os.getenv("OPENAI_MODEL", "gpt-5-mini"),
+    "messages": [
+        {"role": "system", "content": "You are terse."},
+        {"role": "user", "content": "Say ok."}
+    ],
+    "max_completion_tokens": 5  # ✅ correct param for GPT-5
+}
 
-print("Status:", r.status_code)
-print("Body:", r.text[:200])
+async def _one(cx: httpx.AsyncClient):
+    t0 = time.perf_counter()
+    r = await cx.post(URL, json=BODY)
+    return r, time.perf_counter() - t0
 
+async def main(n: int = 10):
+    # One shared client -> concurrent requests reuse pooled connections
+    headers = {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"}
+    async with httpx.AsyncClient(headers=headers, timeout=20) as cx:
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*[_one(cx) for _ in range(n)])
+        total = time.perf_counter() - t0
+
+    for i, (r, lat) in enumerate(results, 1):
+        print(f"#{i:<3} status={r.status_code} latency={lat * 1000:.0f}ms")
+    lats = sorted(lat for _, lat in results)
+    p95 = lats[min(len(lats) - 1, int(round(0.95 * (len(lats) - 1))))]
+    ok = sum(1 for r, _ in results if r.status_code < 400)
+    print(f"p50={statistics.median(lats) * 1000:.0f}ms p95={p95 * 1000:.0f}ms")
+    print(f"{ok}/{n} ok in {total:.2f}s -> {n / total:.2f} req/s")
+    print("Body:", results[0][0].text[:200])
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Concurrent OpenAI smoke test / latency check")
+    ap.add_argument("--concurrency", "-n", type=int, default=10, help="number of parallel requests")
+    args = ap.parse_args()
+    asyncio.run(main(args.concurrency))
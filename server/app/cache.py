@@ -0,0 +1,97 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+class AsyncTTLCache:
+    """
+    Small in-process LRU cache with a per-entry TTL.
+    Concurrent misses on the same key share one in-flight fetch, so N
+    simultaneous callers trigger a single fetch and all get its result.
+    """
+
+    def __init__(self, ttl_s: float, maxsize: int = 1024):
+        self.ttl_s = ttl_s
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        hit = self._data.get(key)
+        if hit is None:
+            return None
+        stored_at, value = hit
+        if time.monotonic() - stored_at > self.ttl_s:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    # Async hooks used by get_or_fetch, so other backends can plug in below
+    async def aget(self, key: Hashable) -> Optional[Any]:
+        return self.get(key)
+
+    async def aset(self, key: Hashable, value: Any) -> None:
+        self.set(key, value)
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for `key`, or await `fetch()` and cache it.
+        `None` results are never cached, but callers that joined the same
+        in-flight fetch all receive it rather than each fetching again.
+        """
+        value = await self.aget(key)
+        if value is not None:
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_set(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: one caller being cancelled must not cancel the fetch the others await
+        return await asyncio.shield(task)
+
+    async def _fetch_and_set(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        # Another fetch may have filled the entry since our miss
+        value = await self.aget(key)
+        if value is None:
+            value = await fetch()
+            if value is not None:
+                await self.aset(key, value)
+        return value
+
+class RedisTTLCache(AsyncTTLCache):
+    """
+    AsyncTTLCache backed by Redis, so entries are shared across workers/restarts.
+    Keys must be str and values bytes; concurrent misses are coalesced per process.
+    Redis being unavailable degrades to misses / skipped writes, never to an error.
+    """
+
+    def __init__(self, url: str, ttl_s: float, prefix: str = ""):
+        super().__init__(ttl_s)
+        from redis import RedisError, asyncio as aioredis
+        self._redis = aioredis.from_url(url)
+        self._errors = (RedisError, OSError)
+        self.prefix = prefix
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        try:
+            return await self._redis.get(self.prefix + key)
+        except self._errors as e:
+            log.warning("Redis get failed, treating as a miss: %s", e)
+            return None
+
+    async def aset(self, key: str, value: bytes) -> None:
+        try:
+            await self._redis.set(self.prefix + key, value, ex=max(1, int(self.ttl_s)))
+        except self._errors as e:
+            log.warning("Redis set failed, entry not cached: %s", e)
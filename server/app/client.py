@@ -0,0 +1,27 @@
+import httpx
+from typing import Optional
+
+# One pooled client for Nominatim, Wikipedia and OpenAI so keep-alive / HTTP/2
+# connections survive across requests instead of re-handshaking every call.
+_client: Optional[httpx.AsyncClient] = None
+# httpx drops idle connections after 5 s by default, which would discard the
+# boot-time warm-up and most reuse between /plan calls
+KEEPALIVE_EXPIRY = 30
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=60,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64,
+                                keepalive_expiry=KEEPALIVE_EXPIRY),
+        )
+    return _client
+
+async def close_client() -> None:
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
@@ -1,153 +1,363 @@
 import os
-import json
 import httpx
+import orjson
+import random
+import hashlib
+import functools
+import fastjsonschema
 import asyncio
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 
-OPENAI_API = "https://api.openai.com/v1/chat/completions"
+from .cache import AsyncTTLCache, RedisTTLCache
+from .client import get_client
 
-def _headers() -> Dict[str, str]:
+OPENAI_HOST = "https://api.openai.com"
+OPENAI_API = f"{OPENAI_HOST}/v1/chat/completions"
+MAX_BACKOFF_S = 60
+_RETRYABLE = (429, 500, 502, 503, 504)
+MAX_CANDIDATES = 6  # POIs sent per prompt (token pressure)
+
+def _auth_headers() -> Dict[str, str]:
     key = os.getenv("OPENAI_API_KEY")
     if not key:
         raise RuntimeError("Missing OPENAI_API_KEY in .env")
-    hdr = {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+    hdr = {"Authorization": f"Bearer {key}"}
     org = os.getenv("OPENAI_ORG_ID")  # optional
     if org:
         hdr["OpenAI-Organization"] = org
     return hdr
 
+def _headers() -> Dict[str, str]:
+    # No Accept-Encoding override: httpx already advertises every codec it can decode
+    # (br and zstd once the `brotli` / `zstandard` packages are installed)
+    return {**_auth_headers(), "Content-Type": "application/json"}
+
 def _model() -> str:
     # Default to GPT-5 Mini; override via .env -> OPENAI_MODEL=gpt-5 or gpt-5-mini
     return os.getenv("OPENAI_MODEL", "gpt-5-mini")
 
+_openai_sem: Optional[asyncio.Semaphore] = None
+
+def _get_openai_sem() -> asyncio.Semaphore:
+    """
+    Process-wide cap on in-flight completion calls (OPENAI_MAX_CONCURRENCY, default 10),
+    so bursts queue here instead of turning into 429 retry storms.
+    """
+    global _openai_sem
+    if _openai_sem is None:
+        _openai_sem = asyncio.Semaphore(int(os.getenv("OPENAI_MAX_CONCURRENCY", "10")))
+    return _openai_sem
+
+async def warm_connection() -> None:
+    """
+    Open a pooled connection to OpenAI ahead of the first completion call
+    (TCP + TLS handshake only; the response itself is ignored).
+    """
+    try:
+        await get_client().head(OPENAI_HOST, timeout=5)
+    except httpx.HTTPError:
+        pass
+
 def _retry_after_seconds(resp: httpx.Response) -> int:
     try:
         return int(resp.headers.get("Retry-After", "0"))
     except Exception:
         return 0
 
+def _retry_wait(resp: httpx.Response, delay: float) -> float:
+    wait = max(_retry_after_seconds(resp), random.uniform(delay / 2, delay))
+    return min(wait, MAX_BACKOFF_S)
+
 async def _post_with_retries(json_payload: Dict[str, Any], max_retries: int = 5) -> httpx.Response:
     """
-    Retries on 429/5xx with exponential backoff (3s, 6s, 12s, 24s, 48s),
-    honoring Retry-After if present.
+    Retries on 429/5xx with jittered exponential backoff (base 3s, 6s, 12s, ...
+    capped at MAX_BACKOFF_S), honoring Retry-After if present. The jitter keeps
+    clients that were throttled together from retrying in lockstep.
     """
     delay = 3
-    async with httpx.AsyncClient(timeout=60) as cx:
-        for attempt in range(1, max_retries + 1):
-            resp = await cx.post(OPENAI_API, headers=_headers(), json=json_payload)
-            if resp.status_code < 400:
-                return resp
-            if resp.status_code in (429, 500, 502, 503, 504):
-                wait = max(_retry_after_seconds(resp), delay)
-                if attempt == max_retries:
-                    resp.raise_for_status()
-                await asyncio.sleep(wait)
-                delay *= 2
-                continue
-            resp.raise_for_status()
+    body = orjson.dumps(json_payload)
+    cx = get_client()
+    for attempt in range(1, max_retries + 1):
+        resp = await cx.post(OPENAI_API, headers=_headers(), content=body, timeout=60)
+        if resp.status_code < 400:
+            return resp
+        if resp.status_code in _RETRYABLE:
+            wait = _retry_wait(resp, delay)
+            if attempt == max_retries:
+                resp.raise_for_status()
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, MAX_BACKOFF_S)
+            continue
+        resp.raise_for_status()
     raise RuntimeError("Unexpected failure in _post_with_retries")
 
-def _itinerary_schema() -> Dict[str, Any]:
-    """Strict JSON schema the model must follow."""
-    return {
-        "name": "Itinerary",
-        "schema": {
-            "type": "object",
-            "properties": {
-                "days": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "date": {"type": "string"},
-                            "items": {
-                                "type": "array",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "name": {"type": "string"},
-                                        "lat": {"type": "number"},
-                                        "lon": {"type": "number"},
-                                        "start": {"type": "string"},
-                                        "end": {"type": "string"},
-                                        "blurb": {"type": "string"},
-                                        "category": {"type": "string"}
-                                    },
-                                    "required": ["name","lat","lon","start","end","blurb","category"],
-                                    "additionalProperties": False
-                                }
-                            }
-                        },
-                        "required": ["date","items"],
-                        "additionalProperties": False
-                    }
-                },
-                "totals": {
+# Strict JSON schema the model must follow (built once at import)
+_ITINERARY_SCHEMA: Dict[str, Any] = {
+    "name": "Itinerary",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "days": {
+                "type": "array",
+                "items": {
                     "type": "object",
                     "properties": {
-                        "cost_low": {"type": "number"},
-                        "cost_high": {"type": "number"}
+                        "date": {"type": "string"},
+                        "items": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "name": {"type": "string"},
+                                    "lat": {"type": "number"},
+                                    "lon": {"type": "number"},
+                                    "start": {"type": "string"},
+                                    "end": {"type": "string"},
+                                    "blurb": {"type": "string"},
+                                    "category": {"type": "string"}
+                                },
+                                "required": ["name","lat","lon","start","end","blurb","category"],
+                                "additionalProperties": False
+                            }
+                        }
                     },
-                    "required": ["cost_low","cost_high"],
-                    "additionalProperties": True
+                    "required": ["date","items"],
+                    "additionalProperties": False
                 }
             },
-            "required": ["days","totals"],
-            "additionalProperties": False
+            "totals": {
+                "type": "object",
+                "properties": {
+                    "cost_low": {"type": "number"},
+                    "cost_high": {"type": "number"}
+                },
+                "required": ["cost_low","cost_high"],
+                "additionalProperties": True
+            }
         },
-        "strict": True
-    }
+        "required": ["days","totals"],
+        "additionalProperties": False
+    },
+    "strict": True
+}
 
-async def plan_with_llm(
+_SYSTEM_MSG = (
+    "You are a precise travel planner. "
+    "Return ONLY valid JSON that matches the provided JSON Schema exactly. "
+    "No extra text."
+)
+
+_RESPONSE_FORMAT = {"type": "json_schema", "json_schema": _ITINERARY_SCHEMA}
+
+# Compiled validators guard against API drift before anything reaches the planner;
+# they raise fastjsonschema.JsonSchemaException, which callers treat as an LLM failure.
+_VALIDATE_PLAN = fastjsonschema.compile(_ITINERARY_SCHEMA["schema"])
+_VALIDATE_DAY = fastjsonschema.compile(_ITINERARY_SCHEMA["schema"]["properties"]["days"]["items"])
+
+# Request-independent part of the user message, serialized once
+# (object body without its braces, so it can be spliced next to the dynamic fields)
+_STATIC_USER_JSON = orjson.dumps({
+    "time_slots": [["09:00","11:00"], ["11:00","13:00"], ["14:00","16:00"], ["16:00","18:00"]],
+    "rules": [
+        "Prefer items that match interests; keep travel time reasonable.",
+        "Up to 4 items per day; fewer is fine if quality is better.",
+        "Each item: one brief, friendly blurb (1–2 sentences)."
+    ],
+}).decode()[1:-1]
+
+def _build_payload(
     city: str,
     dates: List[str],
     interests: List[str],
     pois: List[Dict[str, Any]],
 ) -> Dict[str, Any]:
-    """
-    Ask the LLM to:
-      1) choose ~4 POIs/day that match interests,
-      2) sequence into slots (09–11, 11–13, 14–16, 16–18),
-      3) add short blurbs,
-      4) return STRICT JSON (days[], totals{}).
-    """
-    system_msg = (
-        "You are a precise travel planner. "
-        "Return ONLY valid JSON that matches the provided JSON Schema exactly. "
-        "No extra text."
-    )
-
+    """Chat-completions request body shared by /plan and the Batch API."""
     # Keep prompt lean (tier-1 friendly)
-    user_payload = {
+    dynamic = {
         "city": city,
         "dates": dates,
         "interests": interests or [],
-        "time_slots": [["09:00","11:00"], ["11:00","13:00"], ["14:00","16:00"], ["16:00","18:00"]],
-        "rules": [
-            "Prefer items that match interests; keep travel time reasonable.",
-            "Up to 4 items per day; fewer is fine if quality is better.",
-            "Each item: one brief, friendly blurb (1–2 sentences)."
-        ],
-        "candidates": pois[: min(len(pois), 6)]  # reduce token pressure
+        "candidates": pois[:MAX_CANDIDATES]  # reduce token pressure
     }
+    user_json = "{" + orjson.dumps(dynamic).decode()[1:-1] + "," + _STATIC_USER_JSON + "}"
 
-    json_payload = {
+    return {
         "model": _model(),
         "temperature": 0.4,
-        "response_format": {
-            "type": "json_schema",
-            "json_schema": _itinerary_schema()
-        },
+        "response_format": _RESPONSE_FORMAT,
         "max_completion_tokens": 400,  # GPT-5 param (not max_tokens)
         "messages": [
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": json.dumps(user_payload)}
+            {"role": "system", "content": _SYSTEM_MSG},
+            {"role": "user", "content": user_json}
         ]
     }
 
-    resp = await _post_with_retries(json_payload, max_retries=5)
-    data = resp.json()
-
-    # With response_format=json_schema, content is guaranteed to be valid JSON per schema
+def _parse_plan(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract the itinerary from a chat-completions response body."""
     content = data["choices"][0]["message"]["content"]
-    return json.loads(content)
+    return _VALIDATE_PLAN(orjson.loads(content))
+
+# ---------- Plan cache ----------
+_plan_cache: Optional[AsyncTTLCache] = None
+
+def _get_plan_cache() -> Optional[AsyncTTLCache]:
+    """
+    Content-addressed cache of finished itineraries (values are orjson bytes).
+    Redis when REDIS_URL is set, in-process otherwise; PLAN_CACHE_TTL_S=0 disables it.
+    Built lazily so that .env has been loaded by then.
+    """
+    global _plan_cache
+    ttl_s = float(os.getenv("PLAN_CACHE_TTL_S", "86400"))
+    if ttl_s <= 0:
+        return None
+    if _plan_cache is None:
+        url = os.getenv("REDIS_URL")
+        _plan_cache = (RedisTTLCache(url, ttl_s, prefix="voyagecraft:plan:") if url
+                       else AsyncTTLCache(ttl_s, maxsize=10_000))
+    return _plan_cache
+
+def _plan_key(city: str, dates: List[str], interests: List[str], pois: List[Dict[str, Any]]) -> str:
+    """Stable hash of everything that shapes the prompt."""
+    raw = orjson.dumps({
+        "m": _model(),
+        "c": city.strip().casefold(),
+        "d": dates,
+        "i": sorted(interests or []),
+        "p": [(p["name"], round(p["lat"], 3), round(p["lon"], 3)) for p in pois[:MAX_CANDIDATES]],
+    })
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def _cached_plan(fn):
+    """Serve identical plan requests from the plan cache; only successful plans are stored."""
+    @functools.wraps(fn)
+    async def wrapper(city: str, dates: List[str], interests: List[str],
+                      pois: List[Dict[str, Any]]) -> Dict[str, Any]:
+        cache = _get_plan_cache()
+        if cache is None:
+            return await fn(city, dates, interests, pois)
+
+        async def _fetch() -> bytes:
+            return orjson.dumps(await fn(city, dates, interests, pois))
+
+        # Decode per call: callers mutate the plan (scores), the cached bytes stay pristine
+        return orjson.loads(await cache.get_or_fetch(_plan_key(city, dates, interests, pois), _fetch))
+    return wrapper
+
+@_cached_plan
+async def plan_with_llm(
+    city: str,
+    dates: List[str],
+    interests: List[str],
+    pois: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Ask the LLM to:
+      1) choose ~4 POIs/day that match interests,
+      2) sequence into slots (09–11, 11–13, 14–16, 16–18),
+      3) add short blurbs,
+      4) return STRICT JSON (days[], totals{}).
+    """
+    json_payload = _build_payload(city, dates, interests, pois)
+    async with _get_openai_sem():
+        resp = await _post_with_retries(json_payload, max_retries=5)
+    return _parse_plan(orjson.loads(resp.content))
+
+class _DayScanner:
+    """
+    Incremental scanner over the streamed itinerary JSON. `feed()` returns every
+    `days[i]` object whose closing brace has arrived, so callers can act on a
+    day before the rest of the completion is generated.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_str = False
+        self._esc = False
+        self._day_start = -1
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.text += chunk
+        done: List[Dict[str, Any]] = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                # The root object's only array is `days`, so an object opened
+                # directly inside it is a day
+                if ch == "{" and self._stack == ["{", "["]:
+                    self._day_start = i
+                self._stack.append(ch)
+            elif ch in "}]":
+                self._stack.pop()
+                if ch == "}" and self._day_start >= 0 and self._stack == ["{", "["]:
+                    done.append(orjson.loads(text[self._day_start:i + 1]))
+                    self._day_start = -1
+        self._pos = len(text)
+        return done
+
+async def plan_with_llm_stream(
+    city: str,
+    dates: List[str],
+    interests: List[str],
+    pois: List[Dict[str, Any]],
+    max_retries: int = 5,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of plan_with_llm (stream=true). Yields ("day", day) as soon
+    as each day object is complete, then ("plan", itinerary) once the response ends.
+    Retries like _post_with_retries, as long as nothing has been streamed yet.
+    Shares the plan cache with plan_with_llm.
+    """
+    cache = _get_plan_cache()
+    key = _plan_key(city, dates, interests, pois) if cache else ""
+    cached = await cache.aget(key) if cache else None
+    if cached is not None:
+        plan = orjson.loads(cached)
+        for day in plan["days"]:
+            yield "day", day
+        yield "plan", plan
+        return
+
+    body = orjson.dumps({**_build_payload(city, dates, interests, pois), "stream": True})
+    delay = 3
+    cx = get_client()
+    async with _get_openai_sem():
+        for attempt in range(1, max_retries + 1):
+            async with cx.stream("POST", OPENAI_API, headers=_headers(), content=body, timeout=60) as resp:
+                if resp.status_code >= 400:
+                    await resp.aread()
+                    if resp.status_code not in _RETRYABLE or attempt == max_retries:
+                        resp.raise_for_status()
+                    wait = _retry_wait(resp, delay)
+                else:
+                    scanner = _DayScanner()
+                    async for line in resp.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        data = line[len("data: "):]
+                        if data == "[DONE]":
+                            break
+                        choices = orjson.loads(data).get("choices")
+                        delta = choices[0].get("delta", {}).get("content") if choices else None
+                        if delta:
+                            for day in scanner.feed(delta):
+                                yield "day", _VALIDATE_DAY(day)
+                    plan = _VALIDATE_PLAN(orjson.loads(scanner.text))
+                    if cache:
+                        await cache.aset(key, orjson.dumps(plan))
+                    yield "plan", plan
+                    return
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, MAX_BACKOFF_S)
+        raise RuntimeError("Unexpected failure in plan_with_llm_stream")
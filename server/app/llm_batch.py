@@ -0,0 +1,164 @@
+"""
+Bulk itinerary generation through the OpenAI Batch API
+(half the price of chat/completions, results within a 24h window).
+Interactive /plan stays on chat/completions.
+
+Usage:
+    python -m server.app.llm_batch cities.json > plans.json
+
+cities.json is a list of /plan-shaped requests:
+    [{"destination": "Istanbul", "start_date": "2025-08-20",
+      "end_date": "2025-08-22", "interests": ["history"]}, ...]
+"""
+
+import os
+import sys
+import json
+import asyncio
+from typing import List, Dict, Any, Tuple
+from dotenv import load_dotenv
+
+from .client import get_client, close_client
+from .llm import OPENAI_HOST, MAX_CANDIDATES, _auth_headers, _headers, _build_payload, _parse_plan
+from .planner import nearest_pois
+from .tools import geocode_city, wiki_geosearch, date_range
+
+CHAT_ENDPOINT = "/v1/chat/completions"
+
+async def submit_batch(requests: List[Dict[str, Any]]) -> str:
+    """
+    Upload `requests` ([{custom_id, body}]) as a JSONL file and start a batch job.
+    Returns the batch id.
+    """
+    lines = [
+        json.dumps({"custom_id": r["custom_id"], "method": "POST", "url": CHAT_ENDPOINT, "body": r["body"]})
+        for r in requests
+    ]
+    cx = get_client()
+    up = await cx.post(
+        f"{OPENAI_HOST}/v1/files",
+        headers=_auth_headers(),
+        data={"purpose": "batch"},
+        files={"file": ("plans.jsonl", "\n".join(lines).encode(), "application/jsonl")},
+    )
+    up.raise_for_status()
+    r = await cx.post(
+        f"{OPENAI_HOST}/v1/batches",
+        headers=_headers(),
+        json={"input_file_id": up.json()["id"], "endpoint": CHAT_ENDPOINT, "completion_window": "24h"},
+    )
+    r.raise_for_status()
+    return r.json()["id"]
+
+async def wait_for_batch(batch_id: str, poll_s: float = 30) -> Dict[str, Any]:
+    """Poll until the batch completes; raises if it failed, expired or was cancelled."""
+    cx = get_client()
+    while True:
+        r = await cx.get(f"{OPENAI_HOST}/v1/batches/{batch_id}", headers=_headers())
+        r.raise_for_status()
+        batch = r.json()
+        if batch["status"] == "completed":
+            return batch
+        if batch["status"] in ("failed", "expired", "cancelled"):
+            raise RuntimeError(f"Batch {batch_id} ended with status {batch['status']}")
+        await asyncio.sleep(poll_s)
+
+async def _file_lines(file_id: str) -> List[str]:
+    r = await get_client().get(f"{OPENAI_HOST}/v1/files/{file_id}/content", headers=_auth_headers())
+    r.raise_for_status()
+    return r.text.splitlines()
+
+async def fetch_results(batch: Dict[str, Any]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    """
+    Download the output and error files of a completed batch
+    -> ({custom_id: itinerary}, {custom_id: error}).
+    A row that failed or doesn't parse/validate is reported in the second dict, not raised,
+    so one bad output can't throw away the rest of the batch.
+    """
+    # Successful requests land in output_file_id, failed ones in error_file_id;
+    # either is null when it would be empty (e.g. every row failed)
+    lines: List[str] = []
+    for field in ("output_file_id", "error_file_id"):
+        if batch.get(field):
+            lines += await _file_lines(batch[field])
+    plans: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {}
+    for n, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        custom_id = f"line {n}"
+        try:
+            row = json.loads(line)
+            custom_id = row.get("custom_id") or custom_id
+            resp = row.get("response") or {}
+            if resp.get("status_code") != 200:
+                err = row.get("error")
+                errors[custom_id] = (f"{err.get('code')}: {err.get('message')}" if isinstance(err, dict)
+                                     else f"status {resp.get('status_code')}: {resp.get('body')}")
+                continue
+            plans[custom_id] = _parse_plan(resp["body"])
+        except Exception as e:
+            errors[custom_id] = f"{type(e).__name__}: {e}"
+    return plans, errors
+
+async def _build_requests(trips: List[Dict[str, Any]],
+                          email: str) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    """
+    Geocode + fetch POIs for every trip, then build its chat-completions body.
+    Returns (requests, {"<index>|<destination>": reason}); a trip that can't be
+    planned (bad input, unknown city, upstream error) is skipped, not raised.
+    """
+    async def _one(n: int, trip: Dict[str, Any]) -> Dict[str, Any]:
+        dest = trip["destination"]
+        dates = date_range(trip["start_date"], trip["end_date"])
+        if not dates:
+            raise ValueError("Invalid date range")
+        loc = await geocode_city(dest, email)
+        if not loc:
+            raise ValueError("Destination not found")
+        pois = await wiki_geosearch(lat=loc["lat"], lon=loc["lon"], email=email)
+        if not pois:
+            raise ValueError("No points of interest found")
+        # Same candidate selection as /plan: the POIs nearest the city centre
+        candidates = nearest_pois(pois, loc["lat"], loc["lon"], MAX_CANDIDATES)
+        return {
+            # Input index keeps ids unique (the Batch API requires it) for same-city trips
+            "custom_id": f"{n}|{dest}|{dates[0]}|{dates[-1]}",
+            "body": _build_payload(dest, dates, trip.get("interests") or [], candidates),
+        }
+
+    built = await asyncio.gather(*[_one(n, t) for n, t in enumerate(trips)], return_exceptions=True)
+    requests: List[Dict[str, Any]] = []
+    skipped: Dict[str, str] = {}
+    for n, (trip, b) in enumerate(zip(trips, built)):
+        if isinstance(b, BaseException):
+            dest = trip.get("destination") if isinstance(trip, dict) else None
+            skipped[f"{n}|{dest}"] = f"{type(b).__name__}: {b}"
+        else:
+            requests.append(b)
+    return requests, skipped
+
+async def _main(path: str) -> None:
+    with open(path, encoding="utf-8") as f:
+        trips = json.load(f)
+    email = os.getenv("USER_AGENT_EMAIL", "dev@example.com")
+    try:
+        requests, skipped = await _build_requests(trips, email)
+        for trip_id, err in skipped.items():
+            print(f"Skipped {trip_id}: {err}", file=sys.stderr)
+        if not requests:
+            sys.exit("No plannable trips in input")
+        batch_id = await submit_batch(requests)
+        print(f"Submitted batch {batch_id} ({len(requests)} trips)", file=sys.stderr)
+        plans, errors = await fetch_results(await wait_for_batch(batch_id))
+    finally:
+        await close_client()
+    for custom_id, err in errors.items():
+        print(f"Skipped {custom_id}: {err}", file=sys.stderr)
+    print(json.dumps(plans, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python -m server.app.llm_batch cities.json")
+    load_dotenv()
+    asyncio.run(_main(sys.argv[1]))
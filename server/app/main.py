@@ -1,18 +1,68 @@
 # server/app/main.py
 
 import os
-from typing import List, Optional
+import time
+import asyncio
+import orjson
+from typing import List, Optional, Tuple, Union
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
 from dotenv import load_dotenv
 
-from .tools import geocode_city, wiki_geosearch, date_range
-from .llm import plan_with_llm
-from .planner import enrich_with_scores
+from .client import KEEPALIVE_EXPIRY, get_client, close_client
+from .tools import geocode_city, wiki_geosearch, date_range, _headers as tool_headers
+from .llm import OPENAI_HOST, MAX_CANDIDATES, plan_with_llm, plan_with_llm_stream, warm_connection
+from .planner_kernels import warmup as warmup_kernels
+from .planner import POISet, enrich_with_scores, nearest_pois, score_day
+
+# libuv-based event loop when available (Linux/macOS); stock asyncio otherwise
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
 
 load_dotenv()
+# JSON responses use FastAPI's default: with a response_model set, Pydantic
+# serializes straight to JSON bytes (ORJSONResponse is deprecated and slower there)
 app = FastAPI(title="VoyageCraft Travel Agent", version="0.1.0")
 
+# Caps how many plans of a /plan/batch call run at once (OpenAI rate limits)
+_BATCH_SEM = asyncio.Semaphore(int(os.getenv("PLAN_BATCH_CONCURRENCY", "4")))
+# Hosts every /plan talks to; connections are pre-opened at startup
+_UPSTREAMS = (OPENAI_HOST, "https://en.wikipedia.org", "https://nominatim.openstreetmap.org")
+# Strong refs to fire-and-forget tasks so they aren't garbage-collected mid-flight
+_background_tasks: set = set()
+# When OpenAI was last warmed (monotonic s); that connection stays pooled for KEEPALIVE_EXPIRY
+_last_warm = 0.0
+
+
+# ---------- Lifecycle ----------
+@app.on_event("startup")
+async def _startup():
+    global _last_warm
+    # Shared pooled client for every outbound call (OSM, Wikipedia, OpenAI)
+    app.state.http = get_client()
+    # Pay the TCP/TLS handshakes now rather than on the first user request;
+    # bounded so a slow upstream can't hold up boot. OSM/Wikipedia policy wants an identifying UA.
+    ua = tool_headers(os.getenv("USER_AGENT_EMAIL", "dev@example.com"))
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*[app.state.http.head(u, headers=ua, timeout=5) for u in _UPSTREAMS],
+                           return_exceptions=True),
+            timeout=5,
+        )
+    except asyncio.TimeoutError:
+        pass
+    _last_warm = time.monotonic()
+    # Compile (or load cached) scoring kernels before the first request
+    warmup_kernels()
+
+@app.on_event("shutdown")
+async def _shutdown():
+    await close_client()
+
 
 # ---------- Schemas ----------
 class PlanRequest(BaseModel):
@@ -23,9 +73,16 @@ class PlanRequest(BaseModel):
     interests: Optional[List[str]] = Field(default_factory=list)
 
 class PlanResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     days: list
     totals: dict
 
+class BatchItemError(BaseModel):
+    """Stands in for a /plan/batch entry that failed; the other entries are unaffected."""
+    status_code: int
+    error: str
+
 
 # ---------- Health ----------
 @app.get("/health")
@@ -34,34 +91,41 @@ async def health():
 
 
 # ---------- Fallback (used if LLM is rate-limited or errors) ----------
+_FALLBACK_ITEMS_PER_DAY = 4
+_FALLBACK_SLOT = {"start": "09:00", "end": "11:00", "blurb": "(fallback) Popular spot"}
+
 def _fallback_plan(dates: List[str], pois: List[dict]) -> dict:
-    items_per_day = 4
-    out_days = []
-    idx = 0
-    for d in dates:
-        day_items = []
-        for _ in range(items_per_day):
-            if idx >= len(pois):
-                break
-            p = {**pois[idx], "start": "09:00", "end": "11:00", "blurb": "(fallback) Popular spot"}
-            day_items.append(p)
-            idx += 1
-        out_days.append({"date": d, "items": day_items})
-    return {"days": out_days, "totals": {}}
+    n = _FALLBACK_ITEMS_PER_DAY
+    days = [
+        {"date": d, "items": [{**p, **_FALLBACK_SLOT} for p in pois[i * n:(i + 1) * n]]}
+        for i, d in enumerate(dates)
+    ]
+    return {"days": days, "totals": {}}
 
 
 # ---------- Main endpoint ----------
-@app.post("/plan", response_model=PlanResponse)
-async def plan_trip(req: PlanRequest):
+async def _prepare(req: PlanRequest) -> Tuple[List[str], List[dict], POISet, List[dict]]:
     """
-    Flow:
-      1) Geocode destination (OSM Nominatim)
-      2) Fetch nearby POIs (Wikipedia Geosearch)
-      3) Ask LLM to pick/sequence + write blurbs (strict JSON)  -> fallback if it fails
-      4) Enrich with scores and totals
+    Steps 0-2 of the /plan flow: dates, geocode, nearby POIs.
+    Returns (dates, pois, poi_set, llm_candidates).
     """
+    global _last_warm
     email = os.getenv("USER_AGENT_EMAIL", "dev@example.com")
 
+    # Dates (cheap, no I/O)
+    dates = date_range(req.start_date, req.end_date)
+    if not dates:
+        raise HTTPException(status_code=400, detail="Invalid date range")
+
+    # Pre-establish the OpenAI TLS session while OSM/Wikipedia are in flight; at most
+    # once per keep-alive window, since the previous warm-up's connection is still pooled
+    now = time.monotonic()
+    if now - _last_warm >= KEEPALIVE_EXPIRY:
+        _last_warm = now
+        warm = asyncio.create_task(warm_connection())
+        _background_tasks.add(warm)
+        warm.add_done_callback(_background_tasks.discard)
+
     # 1) Geocode
     loc = await geocode_city(req.destination, email)
     if not loc:
@@ -71,18 +135,95 @@ async def plan_trip(req: PlanRequest):
     pois = await wiki_geosearch(lat=loc["lat"], lon=loc["lon"], email=email)
     if not pois:
         raise HTTPException(status_code=404, detail="No points of interest found")
+    poi_set = POISet.from_pois(pois)
+    candidates = nearest_pois(pois, loc["lat"], loc["lon"], MAX_CANDIDATES, poi_set)
+    return dates, pois, poi_set, candidates
 
-    # Dates
-    dates = date_range(req.start_date, req.end_date)
-    if not dates:
-        raise HTTPException(status_code=400, detail="Invalid date range")
+@app.post("/plan", response_model=PlanResponse)
+async def plan_trip(req: PlanRequest):
+    """
+    Flow:
+      0) Validate dates, start warming the OpenAI connection in the background
+      1) Geocode destination (OSM Nominatim)
+      2) Fetch nearby POIs (Wikipedia Geosearch), keep the closest few for the LLM
+      3) Ask LLM to pick/sequence + write blurbs (strict JSON)  -> fallback if it fails
+      4) Enrich with scores and totals
+    """
+    dates, pois, poi_set, candidates = await _prepare(req)
 
     # 3) Plan with LLM (fallback on any error, e.g., 429 rate limit)
     try:
-        llm_plan = await plan_with_llm(req.destination, dates, req.interests or [], pois)
+        llm_plan = await plan_with_llm(req.destination, dates, req.interests or [], candidates)
     except Exception:
         llm_plan = _fallback_plan(dates, pois[:16])
 
     # 4) Enrich and return
-    final_plan = enrich_with_scores(llm_plan)
-    return PlanResponse(**final_plan)
\ No newline at end of file
+    final_plan = enrich_with_scores(llm_plan, poi_set)
+    # enrich_with_scores yields a controlled shape: build the model without re-validating
+    # (FastAPI passes an instance of the response_model through as-is)
+    return PlanResponse.model_construct(**final_plan)
+
+
+def _sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+@app.post("/plan/stream")
+async def plan_trip_stream(req: PlanRequest):
+    """
+    Same flow as /plan, streamed as Server-Sent Events:
+      event: day     -> one scored day, as soon as the LLM has finished it
+      event: totals  -> cost bands, once the whole itinerary is in
+    If the LLM fails midway, the remaining days come from the fallback plan.
+    """
+    dates, pois, poi_set, candidates = await _prepare(req)
+
+    async def _events():
+        sent = 0
+        try:
+            async for kind, data in plan_with_llm_stream(req.destination, dates, req.interests or [], candidates):
+                if kind == "day":
+                    data["score"] = score_day(data.get("items", []), poi_set)
+                    sent += 1
+                    yield _sse("day", data)
+                else:
+                    totals = enrich_with_scores(data, poi_set)["totals"]
+        except Exception:
+            fallback = enrich_with_scores(_fallback_plan(dates, pois[:16]), poi_set)
+            for day in fallback["days"][sent:]:
+                yield _sse("day", day)
+            totals = fallback["totals"]
+        yield _sse("totals", totals)
+
+    return StreamingResponse(_events(), media_type="text/event-stream")
+
+
+@app.post("/plan/batch", response_model=List[Union[PlanResponse, BatchItemError]])
+async def plan_batch(reqs: List[PlanRequest]):
+    """
+    Plan several trips concurrently; at most PLAN_BATCH_CONCURRENCY run at once.
+    Responses are returned in request order. A trip that fails (unknown destination,
+    bad date range, ...) yields a BatchItemError in its slot instead of failing the batch.
+    """
+    async def _one(r: PlanRequest):
+        async with _BATCH_SEM:
+            try:
+                return await plan_trip(r)
+            except HTTPException as e:
+                return BatchItemError(status_code=e.status_code, error=str(e.detail))
+            except Exception:
+                return BatchItemError(status_code=500, error="Internal error")
+
+    return await asyncio.gather(*[_one(r) for r in reqs])
+
+
+if __name__ == "__main__":
+    # python -m server.app.main  (uvicorn picks uvloop + httptools when installed)
+    import uvicorn
+    uvicorn.run(
+        "server.app.main:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="auto",
+        http="auto",
+    )
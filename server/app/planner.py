@@ -1,39 +1,98 @@
-from typing import List, Dict, Any
-from math import radians, sin, cos, asin, sqrt
-
-def _haversine_km(a: Dict[str, Any], b: Dict[str, Any]) -> float:
-    """Great-circle distance in km between two lat/lon points."""
-    lat1, lon1 = a.get("lat"), a.get("lon")
-    lat2, lon2 = b.get("lat"), b.get("lon")
-    if None in (lat1, lon1, lat2, lon2):
-        return 0.0
-    R = 6371.0
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    h = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    return 2 * R * asin(sqrt(h))
-
-def score_day(items: List[Dict[str, Any]]) -> float:
+import numpy as np
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional
+
+from .planner_kernels import haversine_km, score_days
+
+@dataclass
+class POISet:
+    """
+    Struct-of-arrays view of a POI list: coordinates live in one contiguous
+    (N, 2) array so distance work is vectorized instead of per-dict lookups.
+    The list-of-dict form is still what goes into the LLM prompt.
+    """
+    names: List[str]
+    coords: np.ndarray      # (N, 2) float64 lat/lon
+    categories: np.ndarray  # (N,) object
+    index: Dict[str, int] = field(default_factory=dict)  # name -> row
+
+    @classmethod
+    def from_pois(cls, pois: List[Dict[str, Any]]) -> "POISet":
+        names = [p["name"] for p in pois]
+        return cls(
+            names=names,
+            coords=_coords(pois),
+            categories=np.array([p.get("category", "other") for p in pois], dtype=object),
+            index={n: i for i, n in enumerate(names)},
+        )
+
+def _coords(items: List[Dict[str, Any]], poi_set: Optional[POISet] = None) -> np.ndarray:
+    """
+    (N, 2) float64 array of lat/lon; missing values become NaN.
+    Items that name a known POI get the source coordinates written back, so the
+    plan shows the same positions it was scored on (the LLM may echo them rounded
+    or wrong); if every item is known, rows are sliced straight out of `poi_set`.
+    """
+    if poi_set is not None and items:
+        rows = [poi_set.index.get(x.get("name"), -1) for x in items]
+        for x, r in zip(items, rows):
+            if r >= 0:
+                x["lat"], x["lon"] = poi_set.coords[r].tolist()
+        if min(rows) >= 0:
+            return poi_set.coords[rows]
+    return np.array(
+        [[np.nan if x.get("lat") is None else x["lat"],
+          np.nan if x.get("lon") is None else x["lon"]] for x in items],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+
+def nearest_k(poi_set: POISet, lat: float, lon: float, k: int) -> np.ndarray:
+    """
+    Row indices of the `k` POIs closest to (lat, lon), nearest first.
+    Uses an O(N) argpartition selection; only the k winners get sorted.
+    """
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    rad = np.deg2rad(poi_set.coords)
+    d = haversine_km(np.deg2rad(lat), np.deg2rad(lon), rad[:, 0], rad[:, 1])
+    idx = np.argpartition(d, k - 1)[:k] if k < len(d) else np.arange(len(d))
+    return idx[np.argsort(d[idx], kind="stable")]
+
+def nearest_pois(pois: List[Dict[str, Any]], lat: float, lon: float, k: int,
+                 poi_set: Optional[POISet] = None) -> List[Dict[str, Any]]:
+    """The `k` POIs closest to (lat, lon), nearest first (what the LLM gets as candidates)."""
+    poi_set = poi_set if poi_set is not None else POISet.from_pois(pois)
+    return [pois[i] for i in nearest_k(poi_set, lat, lon, k)]
+
+def _score_days(days_items: List[List[Dict[str, Any]]],
+                poi_set: Optional[POISet] = None) -> np.ndarray:
+    """Raw scores for all days in one kernel call over the flattened coordinates."""
+    coords = _coords([x for items in days_items for x in items], poi_set)
+    sizes = np.array([len(items) for items in days_items], dtype=np.int64)
+    n_cats = np.array([len({x.get("category", "other") for x in items}) for items in days_items],
+                      dtype=np.int64)
+    return score_days(np.ascontiguousarray(coords[:, 0]), np.ascontiguousarray(coords[:, 1]),
+                      sizes, n_cats)
+
+def score_day(items: List[Dict[str, Any]], poi_set: Optional[POISet] = None) -> float:
     """
     Score combines:
       - Less walking distance (higher score)
       - More category diversity (slight boost)
     """
-    if not items:
-        return 0.0
-    walk = sum(_haversine_km(items[i], items[i+1]) for i in range(len(items)-1))
-    cats = len({x.get("category", "other") for x in items})
-    score = max(0.0, 10.0 - walk) + 0.5 * cats
-    return round(score, 2)
+    return round(float(_score_days([items], poi_set)[0]), 2)
 
-def enrich_with_scores(plan: Dict[str, Any]) -> Dict[str, Any]:
+def enrich_with_scores(plan: Dict[str, Any], poi_set: Optional[POISet] = None) -> Dict[str, Any]:
     """
     Adds `score` per day and ensures `totals` has cost bands.
     Safe to call on any LLM output that follows our schema.
+    Pass the request's `poi_set` to take coordinates from the source POIs
+    (matching items have their lat/lon replaced with them).
     """
     days = plan.get("days", [])
-    for d in days:
-        d["score"] = score_day(d.get("items", []))
+    days_items = [d.get("items", []) for d in days]
+    for d, score in zip(days, _score_days(days_items, poi_set)):
+        d["score"] = round(float(score), 2)
 
     totals = plan.get("totals") or {}
     num_days = len(days)
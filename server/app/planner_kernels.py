@@ -0,0 +1,80 @@
+"""
+Numeric kernels behind day scoring. Compiled to native code with Numba when it
+is importable; otherwise the equivalent vectorized NumPy versions are used
+(e.g. on Python releases numba has no wheels for yet).
+"""
+
+import math
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # pragma: no cover - depends on the environment
+    njit = None
+
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Element-wise great-circle distance in km; inputs in radians (arrays or scalars)."""
+    h = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h))
+
+# ---------- Numba (loop) versions ----------
+# No fastmath: legs with missing (NaN) coordinates must stay detectable.
+def _haversine_path_km_loop(lats, lons):
+    """Total great-circle length (km) of a lat/lon degree path; NaN legs count as 0."""
+    total = 0.0
+    for i in range(lats.shape[0] - 1):
+        lat1 = math.radians(lats[i])
+        lat2 = math.radians(lats[i + 1])
+        dlon = math.radians(lons[i + 1] - lons[i])
+        h = math.sin((lat2 - lat1) / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
+        d = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+        if not math.isnan(d):
+            total += d
+    return total
+
+def _score_days_loop(lats, lons, sizes, n_cats):
+    """
+    Scores for days flattened into `lats`/`lons` (`sizes[d]` points each):
+    max(0, 10 - walk_km) + 0.5 * n_cats, or 0 for an empty day.
+    """
+    scores = np.zeros(sizes.shape[0])
+    start = 0
+    for day in range(sizes.shape[0]):
+        n = sizes[day]
+        if n > 0:
+            walk = haversine_path_km(lats[start:start + n], lons[start:start + n])
+            scores[day] = max(0.0, 10.0 - walk) + 0.5 * n_cats[day]
+        start += n
+    return scores
+
+# ---------- NumPy fallbacks ----------
+def _haversine_path_km_np(lats, lons):
+    lat, lon = np.deg2rad(lats), np.deg2rad(lons)
+    return float(np.nansum(haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])))
+
+def _score_days_np(lats, lons, sizes, n_cats):
+    walks = np.zeros(sizes.shape[0])
+    if sizes.sum() >= 2:
+        lat, lon = np.deg2rad(lats), np.deg2rad(lons)
+        legs = haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        # Leg k joins point k and k+1 of the flattened path; drop legs crossing a day boundary
+        day_of = np.repeat(np.arange(sizes.shape[0]), sizes)
+        same_day = day_of[:-1] == day_of[1:]
+        np.add.at(walks, day_of[:-1][same_day], np.nan_to_num(legs[same_day]))
+    scores = np.maximum(0.0, 10.0 - walks) + 0.5 * n_cats
+    return np.where(sizes > 0, scores, 0.0)
+
+if njit is not None:
+    haversine_path_km = njit(cache=True)(_haversine_path_km_loop)
+    score_days = njit(cache=True)(_score_days_loop)
+else:  # pragma: no cover - depends on the environment
+    haversine_path_km = _haversine_path_km_np
+    score_days = _score_days_np
+
+def warmup() -> None:
+    """Trigger JIT compilation (or load it from cache) so no request pays for it."""
+    lats = np.array([41.0, 41.01], dtype=np.float64)
+    lons = np.array([29.0, 29.01], dtype=np.float64)
+    score_days(lats, lons, np.array([2], dtype=np.int64), np.array([1], dtype=np.int64))
@@ -1,6 +1,13 @@
-import httpx, datetime as dt
+import datetime as dt
 from typing import List, Dict, Any, Optional
 
+from .cache import AsyncTTLCache
+from .client import get_client
+
+# Coordinates of a city or the POIs around a point barely change; keep them warm in-process
+_GEOCODE_CACHE = AsyncTTLCache(ttl_s=7 * 24 * 3600, maxsize=1024)
+_GEOSEARCH_CACHE = AsyncTTLCache(ttl_s=24 * 3600, maxsize=1024)
+
 def _headers(email: str):
     # Required by OpenStreetMap Nominatim usage policy
     return {"User-Agent": f"voyagecraft/1.0 ({email})"}
@@ -9,23 +16,35 @@ async def geocode_city(city: str, email: str) -> Optional[Dict[str, float]]:
     """
     Given 'Istanbul', return {'lat': 41.0082, 'lon': 28.9784} (example).
     Uses OpenStreetMap Nominatim (no key required, but valid email is required in UA).
+    Results are cached per normalized city name.
     """
+    key = city.strip().casefold()
+    return await _GEOCODE_CACHE.get_or_fetch(key, lambda: _fetch_geocode(city, email))
+
+async def _fetch_geocode(city: str, email: str) -> Optional[Dict[str, float]]:
     url = "https://nominatim.openstreetmap.org/search"
     params = {"q": city, "format": "json", "limit": 1}
-    async with httpx.AsyncClient(headers=_headers(email), timeout=20) as cx:
-        r = await cx.get(url, params=params)
-        r.raise_for_status()
-        data = r.json()
-        if not data:
-            return None
-        return {"lat": float(data[0]["lat"]), "lon": float(data[0]["lon"])}
+    r = await get_client().get(url, params=params, headers=_headers(email), timeout=20)
+    r.raise_for_status()
+    data = r.json()
+    if not data:
+        return None
+    return {"lat": float(data[0]["lat"]), "lon": float(data[0]["lon"])}
 
 async def wiki_geosearch(lat: float, lon: float, email: str,
                          radius_m: int = 5000, limit: int = 25) -> List[Dict[str, Any]]:
     """
     Find nearby points of interest from Wikipedia around a coordinate.
     Returns a list of {name, lat, lon, category}.
+    Results are cached per (rounded coordinate, radius, limit).
     """
+    key = (round(lat, 4), round(lon, 4), radius_m, limit)
+    return await _GEOSEARCH_CACHE.get_or_fetch(
+        key, lambda: _fetch_geosearch(lat, lon, email, radius_m, limit)
+    )
+
+async def _fetch_geosearch(lat: float, lon: float, email: str,
+                           radius_m: int, limit: int) -> List[Dict[str, Any]]:
     url = "https://en.wikipedia.org/w/api.php"
     params = {
         "action": "query",
@@ -35,14 +54,13 @@ async def wiki_geosearch(lat: float, lon: float, email: str,
         "gslimit": limit,
         "format": "json",
     }
-    async with httpx.AsyncClient(headers=_headers(email), timeout=20) as cx:
-        r = await cx.get(url, params=params)
-        r.raise_for_status()
-        items = r.json().get("query", {}).get("geosearch", [])
-        return [
-            {"name": i["title"], "lat": i["lat"], "lon": i["lon"], "category": "sight"}
-            for i in items
-        ]
+    r = await get_client().get(url, params=params, headers=_headers(email), timeout=20)
+    r.raise_for_status()
+    items = r.json().get("query", {}).get("geosearch", [])
+    return [
+        {"name": i["title"], "lat": i["lat"], "lon": i["lon"], "category": "sight"}
+        for i in items
+    ]
 
 def date_range(start: str, end: str) -> List[str]:
     """
@@ -50,9 +68,5 @@ def date_range(start: str, end: str) -> List[str]:
     '2025-08-20'..'2025-08-22' -> ['2025-08-20','2025-08-21','2025-08-22']
     """
     s = dt.date.fromisoformat(start)
-    e = dt.date.fromisoformat(end)
-    days: List[str] = []
-    while s <= e:
-        days.append(s.isoformat())
-        s += dt.timedelta(days=1)
-    return days
+    n = (dt.date.fromisoformat(end) - s).days + 1
+    return [(s + dt.timedelta(days=i)).isoformat() for i in range(max(n, 0))]
@@ -1,12 +1,16 @@
 # streamlit_app.py
 # VoyageCraft – AI Travel Agent (Streamlit-only, OpenAI + OSM/Wikipedia)
 # - Model: o4-mini (no temperature, no response_format). Token-cap auto-handled.
-# - Per-day calls with retries to stay within Tier-1.
+# - Per-day calls (a few in parallel) with retries to stay within Tier-1.
 # - Multi-interest: pulls OSM POIs per interest + Wikipedia sights; enforces daily mix and global coverage.
 
-import os, json, datetime as dt, asyncio, re
+import os, json, datetime as dt, asyncio, re, threading, weakref
+from collections import Counter, OrderedDict
+from urllib.parse import quote
 import streamlit as st
 import httpx
+import orjson
+from diskcache import Cache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,6 +18,7 @@ load_dotenv()
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
 MODEL = os.getenv("OPENAI_MODEL", "o4-mini")
 USER_AGENT_EMAIL = os.getenv("USER_AGENT_EMAIL", "dev@example.com")
+DAY_CONCURRENCY = 3  # per-day OpenAI calls in flight at once
 
 # ---------------- Utilities ----------------
 def _ua():
@@ -30,67 +35,221 @@ def date_list(start: dt.date, end: dt.date):
         d += dt.timedelta(days=1)
     return out
 
+def _lc(it):
+    # Casefolded name: stored as "_name_lc" when POIs are ingested, derived for anything else
+    return it.get("_name_lc") or (it.get("name") or "").casefold()
+
+def _public(it):
+    # Drop internal "_..." helper fields before an item leaves the app (prompt, output)
+    return {k: v for k, v in it.items() if not k.startswith("_")}
+
+def _name_key(it):
+    return " ".join(_lc(it).split())  # trims and collapses whitespace without a regex
+
 def _dedupe_by_name(items):
     seen, out = set(), []
     for it in items:
-        name = (it.get("name") or "").strip()
-        key = re.sub(r"\s+", " ", name).lower()
+        key = _name_key(it)
         if key and key not in seen:
             seen.add(key); out.append(it)
     return out
 
-CHAIN_WORDS = {"starbucks","mcdonald","kfc","burger king","dunkin","subway","7-eleven","7 11","7-eleven","pizza hut"}
+CHAIN_WORDS = {"starbucks","mcdonald","kfc","burger king","dunkin","subway","7-eleven","7 11","pizza hut"}
+CHAIN_RE = re.compile("|".join(map(re.escape, sorted(CHAIN_WORDS))))  # one scan per casefolded name
+
 def _filter_chains(items, keep_at_least=8):
     # Drop global chains unless we don't have enough items
-    non_chains = [i for i in items if all(w not in i["name"].lower() for w in CHAIN_WORDS)]
+    non_chains = [i for i in items if not CHAIN_RE.search(_lc(i))]
     return non_chains if len(non_chains) >= keep_at_least else items
 
+def _cat(it):
+    return (it.get("category") or "sight").lower()
+
 def _split_by_category(items):
     by = {}
     for it in items:
-        cat = (it.get("category") or "sight").lower()
-        by.setdefault(cat, []).append(it)
+        by.setdefault(_cat(it), []).append(it)
     return by
 
+# ---------------- Shared HTTP clients ----------------
+# httpx connections belong to the event loop that opened them, and Streamlit runs
+# each session (and each _run) on its own loop in its own thread, so pooled clients
+# are kept per loop and only that loop's clients are closed when its work is done (_run).
+_CLIENTS = weakref.WeakKeyDictionary()  # loop -> {kind: AsyncClient}
+
+def _client(kind: str) -> httpx.AsyncClient:
+    clients = _CLIENTS.setdefault(asyncio.get_running_loop(), {})
+    cx = clients.get(kind)
+    if cx is None:
+        limits = httpx.Limits(max_keepalive_connections=32, max_connections=64, keepalive_expiry=30)
+        # HTTP/2: concurrent requests to a host multiplex over one connection
+        if kind == "openai":
+            cx = httpx.AsyncClient(headers={"Authorization": f"Bearer {OPENAI_KEY}"}, http2=True,
+                                   timeout=httpx.Timeout(60.0), limits=limits)
+        else:
+            cx = httpx.AsyncClient(headers=_ua(), http2=True, timeout=httpx.Timeout(20.0), limits=limits)
+        clients[kind] = cx
+    return cx
+
+def _http():
+    # Nominatim / Wikipedia / Overpass
+    return _client("web")
+
+def _openai_http():
+    return _client("openai")
+
+async def _close_clients():
+    # Only the running loop's clients; other sessions may still be using theirs
+    for cx in _CLIENTS.pop(asyncio.get_running_loop(), {}).values():
+        await cx.aclose()
+
+def _run(coro):
+    # asyncio.run + close the pooled clients before the loop goes away
+    async def _main():
+        try:
+            return await coro
+        finally:
+            await _close_clients()
+    return asyncio.run(_main())
+
+async def hedged(coro_factory, hedge_after=2.0):
+    # Await coro_factory(); if it hasn't finished after hedge_after seconds, start a
+    # second identical attempt and return the first success (the other is cancelled).
+    # Raises only if every attempt failed.
+    tasks = {asyncio.create_task(coro_factory())}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            tasks.add(asyncio.create_task(coro_factory()))
+        while True:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            ok = [t for t in done if t.exception() is None]
+            if ok or not pending:
+                return (ok or list(done))[0].result()
+            tasks = pending
+    finally:
+        for t in tasks:
+            t.cancel()
+
+# ---------------- Response cache (disk + memory) ----------------
+# Geocode / Wikipedia / Overpass answers rarely change, so they persist on disk
+# across sessions; a small in-process LRU sits on top for repeat hits.
+# Streamlit re-executes this script on every interaction, so both are created once
+# per process (cache_resource) and shared by all sessions (hence the lock on the LRU);
+# the disk cache lives next to the app, whatever directory it was launched from.
+@st.cache_resource
+def _response_cache():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".vc_cache")
+    return Cache(path), OrderedDict(), threading.Lock()
+
+CACHE, _MEM, _MEM_LOCK = _response_cache()
+DAY = 86400
+_MEM_MAX = 1024
+
+def _cache_get(key):
+    with _MEM_LOCK:
+        if key in _MEM:
+            _MEM.move_to_end(key)
+            return _MEM[key]
+    val = CACHE.get(key)
+    if val is not None:
+        _mem_put(key, val)
+    return val
+
+def _cache_set(key, val, expire):
+    CACHE.set(key, val, expire=expire)
+    _mem_put(key, val)
+
+def _mem_put(key, val):
+    with _MEM_LOCK:
+        _MEM[key] = val; _MEM.move_to_end(key)
+        while len(_MEM) > _MEM_MAX:
+            _MEM.popitem(last=False)
+
 # ---------------- Geocode + Wikipedia ----------------
 async def geocode_city(city: str):
+    key = ("geocode", city.strip().casefold())
+    hit = _cache_get(key)
+    if hit is not None: return hit
     url = "https://nominatim.openstreetmap.org/search"
     params = {"q": city, "format": "json", "limit": 1}
-    async with httpx.AsyncClient(headers=_ua(), timeout=20) as cx:
-        r = await cx.get(url, params=params)
-        r.raise_for_status()
-        data = r.json()
-        if not data: return None
-        return {"lat": float(data[0]["lat"]), "lon": float(data[0]["lon"])}
+    r = await _http().get(url, params=params)
+    r.raise_for_status()
+    data = orjson.loads(r.content)
+    if not data: return None
+    loc = {"lat": float(data[0]["lat"]), "lon": float(data[0]["lon"])}
+    _cache_set(key, loc, expire=30*DAY)
+    return loc
 
 async def wiki_geosearch(lat: float, lon: float, radius_m=5000, limit=40):
+    key = ("wiki_geosearch", round(lat, 4), round(lon, 4), radius_m, limit)
+    hit = _cache_get(key)
+    if hit is not None: return hit
     url = "https://en.wikipedia.org/w/api.php"
     params = {
         "action":"query","list":"geosearch","gscoord":f"{lat}|{lon}",
         "gsradius":radius_m,"gslimit":limit,"format":"json"
     }
-    async with httpx.AsyncClient(headers=_ua(), timeout=20) as cx:
-        r = await cx.get(url, params=params)
+    r = await _http().get(url, params=params)
+    r.raise_for_status()
+    items = orjson.loads(r.content).get("query",{}).get("geosearch",[])
+    out = [{"name":i["title"],"lat":i["lat"],"lon":i["lon"],"category":"sight",
+            "_name_lc":i["title"].casefold()} for i in items]
+    _cache_set(key, out, expire=7*DAY)
+    return out
+
+WIKI_LANGS = ("en", "ja", "tr")  # EN first; ja/tr as common non-EN cases
+
+async def _fetch_lang(lang: str, title: str, chars: int) -> str:
+    # One language's summary, trimmed; "" when missing or on any error
+    try:
+        url = f"https://{lang}.wikipedia.org/api/rest_v1/page/summary/{title}"
+        r = await _http().get(url)
+        if r.status_code == 404:
+            return ""
         r.raise_for_status()
-        items = r.json().get("query",{}).get("geosearch",[])
-        return [{"name":i["title"],"lat":i["lat"],"lon":i["lon"],"category":"sight"} for i in items]
+        txt = (orjson.loads(r.content).get("extract") or "").strip()
+        return (txt[:chars] + "…") if len(txt) > chars else txt
+    except Exception:
+        return ""
+
+# (loop id, cache key) -> Task, so concurrent callers share one lookup. Tasks can only
+# be awaited on their own loop, and each Streamlit session/_run has its own.
+_INFLIGHT = {}
 
 async def wiki_summary(title: str, chars: int = 220) -> str:
-    # Try EN first; if empty, try Japanese (ja) and Turkish (tr) as common cases
-    for lang in ("en", "ja", "tr"):
-        try:
-            url = f"https://{lang}.wikipedia.org/api/rest_v1/page/summary/{title}"
-            async with httpx.AsyncClient(headers=_ua(), timeout=20) as cx:
-                r = await cx.get(url)
-                if r.status_code == 404:
-                    continue
-                r.raise_for_status()
-                data = r.json()
-                txt = (data.get("extract") or "").strip()
-                if txt:
-                    return (txt[:chars] + "…") if len(txt) > chars else txt
-        except Exception:
-            continue
+    key = ("wiki_summary", title, chars)
+    hit = _cache_get(key)
+    if hit is not None: return hit
+    slot = (id(asyncio.get_running_loop()), key)
+    task = _INFLIGHT.get(slot)
+    if task is None:
+        task = asyncio.create_task(_wiki_summary(key, title, chars))
+        _INFLIGHT[slot] = task
+        task.add_done_callback(lambda _: _INFLIGHT.pop(slot, None))
+    # shield: a cancelled caller must not cancel the fetch other callers are awaiting
+    return await asyncio.shield(task)
+
+async def _wiki_summary(key, title: str, chars: int) -> str:
+    # All languages are requested at once; answers are taken in WIKI_LANGS order, so
+    # we return as soon as every preferred language ahead of a non-empty one has come back empty
+    tasks = {asyncio.create_task(hedged(lambda lang=lang: _fetch_lang(lang, title, chars))): lang
+             for lang in WIKI_LANGS}
+    got = {}
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                got[tasks[t]] = t.result()
+            for lang in WIKI_LANGS:
+                if lang not in got: break
+                if got[lang]:
+                    _cache_set(key, got[lang], expire=7*DAY)
+                    return got[lang]
+    finally:
+        for t in tasks:
+            t.cancel()
     # Category-aware fallback if no wiki entry
     tl = title.lower()
     return ("Casual local eatery." if any(k in tl for k in ["cafe","coffee","ramen","sushi","izakaya","yakitori","noodle","donburi","tonkatsu"])
@@ -124,81 +283,170 @@ INTEREST_TAGS = {
     # default will fall back to generic sights
 }
 
-def _overpass_query(lat: float, lon: float, radius_m: int, tag_pairs):
-    # Build a union of node/way queries for given (key, regex) pairs
-    blocks = []
-    for key, regex in tag_pairs:
-        blocks.append(f'  node(around:{radius_m},{lat},{lon})["{key}"~"{regex}"];')
-        blocks.append(f'  way(around:{radius_m},{lat},{lon})["{key}"~"{regex}"];')
-    body = "\n".join(blocks)
-    return f"""
-[out:json][timeout:25];
-(
-{body}
-);
-out center 60;
-""".strip()
-
-async def overpass_for_interest(lat: float, lon: float, interest: str, radius_m=5000, limit=40):
-    tags = INTEREST_TAGS.get(interest.lower())
-    if not tags:
-        # fallback to generic attractions
-        tags = [('tourism', r'attraction|museum|gallery')]
-    q = _overpass_query(lat, lon, radius_m, tags)
-    items = []
-    try:
-        async with httpx.AsyncClient(headers=_ua(), timeout=40) as cx:
-            r = await cx.post("https://overpass-api.de/api/interpreter", data=q)
-            r.raise_for_status()
-            data = r.json()
-            for el in data.get("elements", []):
-                tags = el.get("tags", {})
-                name = tags.get("name") or tags.get("brand")
-                if not name: continue
-                lat0 = el.get("lat") or (el.get("center") or {}).get("lat")
-                lon0 = el.get("lon") or (el.get("center") or {}).get("lon")
-                if lat0 is None or lon0 is None: continue
-                items.append({
-                    "name": name, "lat": float(lat0), "lon": float(lon0),
-                    "category": interest.lower()
-                })
-    except Exception:
-        return []
-    items = _dedupe_by_name(items)[:limit]
-    items = _filter_chains(items, keep_at_least=12)
-    return items
+def _interest_tags(interest: str):
+    # fallback to generic attractions
+    return INTEREST_TAGS.get(interest.lower()) or [('tourism', r'attraction|museum|gallery')]
+
+_SET_MARKER = "vc_set"  # type of the marker elements `make` emits between result sets
+
+def _overpass_query(lat: float, lon: float, radius_m: int, tag_sets, limit=60):
+    # One query, one named result set per entry of tag_sets (a union of node/way
+    # queries for its (key, regex) pairs), each with its own `out center {limit}`
+    # so every interest keeps its own cap. A marker element precedes each set's output.
+    parts = []
+    for n, tag_pairs in enumerate(tag_sets):
+        blocks = []
+        for key, regex in tag_pairs:
+            blocks.append(f'  node(around:{radius_m},{lat},{lon})["{key}"~"{regex}"];')
+            blocks.append(f'  way(around:{radius_m},{lat},{lon})["{key}"~"{regex}"];')
+        body = "\n".join(blocks)
+        parts.append(f"(\n{body}\n)->.i{n};\nmake {_SET_MARKER} idx={n};\nout;\n.i{n} out center {limit};")
+    return "[out:json][timeout:25];\n" + "\n".join(parts)
+
+OVERPASS_HEDGE_S = 10.0  # big unions legitimately take seconds; only hedge real stalls
+
+async def _overpass_post(q: str):
+    r = await _http().post("https://overpass-api.de/api/interpreter", data=q, timeout=40)
+    r.raise_for_status()
+    return orjson.loads(r.content)
+
+async def overpass_for_interests(lat: float, lon: float, interests, radius_m=5000, limit=40):
+    # One Overpass round-trip for all interests: a named set (and output) per interest,
+    # split back apart on the marker elements between them
+    tag_map = {i: _interest_tags(i) for i in interests}
+    by_interest = {i: [] for i in tag_map}
+    if not tag_map:
+        return by_interest
+    names = list(tag_map)
+    q = _overpass_query(lat, lon, radius_m, list(tag_map.values()), limit=60)
+    key = ("overpass", q)
+    data = _cache_get(key)
+    if data is None:
+        try:
+            data = await hedged(lambda: _overpass_post(q), hedge_after=OVERPASS_HEDGE_S)
+        except Exception:
+            return by_interest
+        _cache_set(key, data, expire=DAY)
+    current = None
+    for el in data.get("elements", []):
+        tags = el.get("tags", {})
+        if el.get("type") == _SET_MARKER:
+            current = names[int(tags["idx"])]
+            continue
+        if current is None: continue
+        name = tags.get("name") or tags.get("brand")
+        if not name: continue
+        lat0 = el.get("lat") or (el.get("center") or {}).get("lat")
+        lon0 = el.get("lon") or (el.get("center") or {}).get("lon")
+        if lat0 is None or lon0 is None: continue
+        by_interest[current].append({
+            "name": name, "lat": float(lat0), "lon": float(lon0),
+            "category": current.lower(), "_name_lc": name.casefold()
+        })
+    for i, items in by_interest.items():
+        items = _dedupe_by_name(items)[:limit]
+        by_interest[i] = _filter_chains(items, keep_at_least=12)
+    return by_interest
 
 async def gather_interest_pois(lat: float, lon: float, interests, radius_m=5000):
-    by_interest = {}
-    for i in interests:
-        by_interest[i] = await overpass_for_interest(lat, lon, i, radius_m=radius_m)
-    return by_interest
+    return await overpass_for_interests(lat, lon, interests, radius_m=radius_m)
 
 # ---------------- OpenAI (per-day) ----------------
-async def _retry_openai(json_body, max_retries=5):
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+_JSON_DEC = json.JSONDecoder()  # raw_decode for salvage (orjson has no partial parse)
+
+class _ObjectScanner:
+    # Incremental brace matcher over streamed text: feed() returns True once the
+    # first top-level {...} has closed (braces inside JSON strings are ignored)
+    def __init__(self):
+        self.buf, self.end = "", -1
+        self.depth, self.in_str, self.esc = 0, False, False
+
+    def feed(self, text):
+        i0 = len(self.buf); self.buf += text
+        for i in range(i0, len(self.buf)):
+            ch = self.buf[i]
+            if self.in_str:
+                if self.esc: self.esc = False
+                elif ch == "\\": self.esc = True
+                elif ch == '"': self.in_str = False
+            elif ch == '"' and self.depth: self.in_str = True
+            elif ch == "{": self.depth += 1
+            elif ch == "}" and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    self.end = i + 1
+                    return True
+        return False
+
+def _openai_error(r):
+    return httpx.HTTPStatusError(
+        f"{r.status_code} {r.reason_phrase}: {r.text[:400]}",
+        request=r.request, response=r
+    )
+
+async def _stream_openai(json_body, max_retries=5):
+    # Streams the completion (SSE) and returns its text as soon as the first JSON
+    # object in it closes, instead of waiting for the whole body. Retries like before.
     delay = 3
-    async with httpx.AsyncClient(timeout=60) as cx:
-        for attempt in range(1, max_retries + 1):
-            r = await cx.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={"Authorization": f"Bearer {OPENAI_KEY}"},
-                json=json_body
-            )
+    cx = _openai_http()
+    body = {**json_body, "stream": True}
+    for attempt in range(1, max_retries + 1):
+        async with cx.stream("POST", OPENAI_URL, content=orjson.dumps(body),
+                             headers={"Content-Type": "application/json"}) as r:
             if r.status_code < 400:
-                return r
-            if r.status_code in (429, 500, 502, 503, 504):
-                ra = r.headers.get("Retry-After")
-                wait = max(int(ra) if ra and ra.isdigit() else 0, delay)
-                if attempt == max_retries:
-                    raise httpx.HTTPStatusError(
-                        f"{r.status_code} {r.reason_phrase}: {r.text[:400]}",
-                        request=r.request, response=r
-                    )
-                await asyncio.sleep(wait); delay *= 2; continue
-            raise httpx.HTTPStatusError(
-                f"{r.status_code} {r.reason_phrase}: {r.text[:400]}",
-                request=r.request, response=r
-            )
+                scan = _ObjectScanner()
+                async for line in r.aiter_lines():
+                    if not line.startswith("data: "): continue
+                    data = line[6:]
+                    if data == "[DONE]": break
+                    choices = orjson.loads(data).get("choices") or [{}]
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta and scan.feed(delta): break
+                return scan.buf[:scan.end] if scan.end >= 0 else scan.buf
+            await r.aread()
+        if r.status_code in (429, 500, 502, 503, 504):
+            ra = r.headers.get("Retry-After")
+            wait = max(int(ra) if ra and ra.isdigit() else 0, delay)
+            if attempt == max_retries:
+                raise _openai_error(r)
+            await asyncio.sleep(wait); delay *= 2; continue
+        raise _openai_error(r)
+
+# Identical on every call (byte-for-byte) so OpenAI's automatic prompt caching can reuse it
+SYSTEM_MSG = ("You are a precise travel planner. Output ONLY JSON with keys: date (string), "
+              "items (array of {name,lat,lon,start,end,blurb,category}). No extra text. "
+              "Candidates use short keys n=name, y=lat, x=lon, c=category; "
+              "return full field names in output.")
+_STATIC = {
+    "time_slots": [["09:00","11:00"],["11:00","13:00"],["14:00","16:00"],["16:00","18:00"]],
+    "rules": [
+        "Pick 3–4 items total.",
+        "Use only items from candidates; copy n/y/x/c into name/lat/lon/category.",
+        "Prefer variety: include at least 2 distinct categories per day.",
+        "If 'food' is present in interests, schedule the food item at 11:00–13:00 or 16:00–18:00.",
+        "Each item: one brief, friendly blurb (1–2 sentences).",
+        "Return ONLY compact JSON: {date, items[]}. No markdown or prose."
+    ],
+}
+
+def _slim(c):
+    # Short keys + ~11 m coordinates: roughly halves the candidate tokens per prompt
+    return {"n": c["name"], "y": round(c["lat"], 4), "x": round(c["lon"], 4),
+            "c": c.get("category", "sight")}
+
+def _parse_reply(content):
+    try:
+        return orjson.loads(content)
+    except Exception:
+        # Salvage: parse just the first object after any leading prose
+        l = content.find("{")
+        if l >= 0:
+            try:
+                return _JSON_DEC.raw_decode(content, l)[0]
+            except ValueError:
+                pass
+        raise ValueError("Model returned non-JSON content")
 
 async def plan_one_day(city, day_iso, interests, candidates, show_debug=False):
     # Build a balanced candidate set: take a slice per interest + sights
@@ -210,44 +458,29 @@ async def plan_one_day(city, day_iso, interests, candidates, show_debug=False):
     merged += by_cat.get("sight", [])[:8]
     merged = _dedupe_by_name(merged)[:14]
 
-    payload = {
-        "city": city,
-        "date": day_iso,
-        "interests": interests or [],
-        "time_slots": [["09:00","11:00"],["11:00","13:00"],["14:00","16:00"],["16:00","18:00"]],
-        "rules": [
-            "Pick 3–4 items total.",
-            "Use only items from candidates; copy name/lat/lon/category.",
-            "Prefer variety: include at least 2 distinct categories per day.",
-            "If 'food' is present in interests, schedule the food item at 11:00–13:00 or 16:00–18:00.",
-            "Each item: one brief, friendly blurb (1–2 sentences).",
-            "Return ONLY compact JSON: {date, items[]}. No markdown or prose."
-        ],
-        "candidates": merged
-    }
+    # Static parts go first so every day's prompt shares the same prefix
+    payload = {**_STATIC, "city": city, "date": day_iso, "interests": list(interests),
+               "candidates": [_slim(c) for c in merged]}
     json_body = {
         "model": MODEL,
         # o4-mini: do NOT send temperature; default=1 enforced
         "messages": [
-            {"role":"system","content":
-                "You are a precise travel planner. Output ONLY JSON with keys: date (string), items (array of {name,lat,lon,start,end,blurb,category}). No extra text."
-            },
-            {"role":"user","content": json.dumps(payload, separators=(',',':'))}
+            {"role":"system","content": SYSTEM_MSG},
+            {"role":"user","content": orjson.dumps(payload).decode()}
         ],
         "stop": ["```"]
     }
     json_body[_token_cap_key(MODEL)] = 220
 
     try:
-        resp = await _retry_openai(json_body, max_retries=5)
-        content = resp.json()["choices"][0]["message"]["content"]
-        try:
-            return json.loads(content), None
-        except Exception:
-            s = content; l = s.find("{"); r = s.rfind("}")
-            if l >= 0 and r > l:
-                return json.loads(s[l:r+1]), None
-            raise ValueError("Model returned non-JSON content")
+        content = await _stream_openai(json_body, max_retries=5)
+        obj = _parse_reply(content)
+        # Candidates went out with rounded coordinates; restore the source values by name
+        src = {c["name"]: c for c in merged}
+        for it in obj.get("items", []):
+            c = src.get(it.get("name"))
+            if c: it["lat"], it["lon"] = c["lat"], c["lon"]
+        return obj, None
     except Exception as e:
         if show_debug:
             return None, f"OpenAI error for {day_iso}: {e}"
@@ -259,48 +492,69 @@ async def _fill_blurb(item):
         item["blurb"] = await wiki_summary(item["name"])
     return item
 
-async def enforce_daily_mix(day_obj, interests, pools_by_interest, sights_pool):
+def _take(pool, day_keys):
+    # Pop (a copy of) the first pool entry that isn't already in the day, or None
+    for n, p in enumerate(pool):
+        if _name_key(p) not in day_keys:
+            return dict(pool.pop(n))
+    return None
+
+def _add(items, cat_counts, day_keys, it, cap=4):
+    # Append `it`; when the day is full, first drop the last item of its most repeated
+    # category (or the last item) so the addition survives the cap
+    if len(items) >= cap:
+        top = max(cat_counts, key=cat_counts.get)
+        same = [n for n, x in enumerate(items) if _cat(x) == top] if cat_counts[top] > 1 else []
+        gone = items.pop(same[-1] if same else -1)
+        cat_counts[_cat(gone)] -= 1
+        if not cat_counts[_cat(gone)]: del cat_counts[_cat(gone)]
+        day_keys.discard(_name_key(gone))
+    items.append(it)
+    cat_counts[_cat(it)] += 1
+    day_keys.add(_name_key(it))
+
+async def enforce_daily_mix(day_obj, interests, pools_by_interest, sights_pool, interests_set=None):
     # Ensure at least 2 distinct categories per day, and place food at lunch/dinner
+    # (interests are expected lowercased; build_plan passes interests_set precomputed)
+    interests_set = interests_set if interests_set is not None else frozenset(interests)
     items = _dedupe_by_name(day_obj.get("items", []))
-    cats = { (it.get("category") or "sight").lower() for it in items }
+    cat_counts = Counter(_cat(it) for it in items)
+    day_keys = {_name_key(it) for it in items}
     # add from pools until we have 2 distinct categories
     wanted = 2
-    if len(cats) < wanted:
+    if len(cat_counts) < wanted:
         for i in interests:
-            pool = pools_by_interest.get(i, [])
-            if pool:
-                cand = dict(pool.pop(0))
-                cand["start"], cand["end"] = "11:00","13:00" if i=="food" else "09:00","11:00"
-                cand["blurb"] = await wiki_summary(cand["name"])
-                items.append(cand)
-                cats.add(i)
-            if len(cats) >= wanted:
+            if i in cat_counts: continue  # same category again adds no variety
+            cand = _take(pools_by_interest.get(i, []), day_keys)
+            if cand:
+                cand["start"], cand["end"] = ("11:00","13:00") if i=="food" else ("09:00","11:00")
+                _add(items, cat_counts, day_keys, cand)
+            if len(cat_counts) >= wanted:
                 break
-        if len(cats) < wanted and sights_pool:
-            s = dict(sights_pool.pop(0))
-            s["start"], s["end"] = "14:00","16:00"
-            s["blurb"] = await wiki_summary(s["name"])
-            items.append(s)
-            cats.add("sight")
+        if len(cat_counts) < wanted and "sight" not in cat_counts:
+            s = _take(sights_pool, day_keys)
+            if s:
+                s["start"], s["end"] = "14:00","16:00"
+                _add(items, cat_counts, day_keys, s)
 
     # If food requested, ensure exactly one food in good slot
-    if "food" in [i.lower() for i in interests]:
-        foods = [it for it in items if (it.get("category") or "") == "food"]
-        if len(foods) == 0 and pools_by_interest.get("food"):
-            f = dict(pools_by_interest["food"].pop(0))
-            f["start"], f["end"] = "11:00","13:00"
-            f["blurb"] = await wiki_summary(f["name"])
-            items.append(f)
-        elif len(foods) > 1:
+    if "food" in interests_set:
+        if not cat_counts["food"]:
+            f = _take(pools_by_interest.get("food", []), day_keys)
+            if f:
+                f["start"], f["end"] = "11:00","13:00"
+                _add(items, cat_counts, day_keys, f)
+        elif cat_counts["food"] > 1:
             # keep the first; demote extras
-            items = [it for it in items if (it.get("category") or "") != "food"] + foods[:1]
+            first_food = next(it for it in items if _cat(it) == "food")
+            items = [it for it in items if _cat(it) != "food"] + [first_food]
         for it in items:
-            if it.get("category") == "food":
+            if _cat(it) == "food":
                 it["start"], it["end"] = ("11:00","13:00") if it.get("start")=="09:00" else (it.get("start","11:00"), it.get("end","13:00"))
 
-    # Cap 4 and ensure blurbs
+    # Cap 4 and ensure blurbs (added items get theirs here, fetched concurrently)
     items = items[:4]
-    items = [await _fill_blurb(it) for it in items]
+    items = list(await asyncio.gather(*(_fill_blurb(it) for it in items)))
     day_obj["items"] = items
     return day_obj
 
@@ -308,13 +562,14 @@ async def enforce_global_coverage(days, interests, pools_by_interest, sights_poo
     # Ensure each requested interest appears at least once across the itinerary
     have = set()
     for d in days:
-        have |= { (it.get("category") or "sight").lower() for it in d.get("items",[]) }
+        have |= {_cat(it) for it in d.get("items",[])}
 
     missing = [i for i in interests if i not in have]
     if not missing:
         return days
 
     # Inject one item for each missing interest into earliest day that can accept it (<=4 items)
+    added = []
     for miss in missing:
         pool = pools_by_interest.get(miss, [])
         if not pool:
@@ -323,45 +578,55 @@ async def enforce_global_coverage(days, interests, pools_by_interest, sights_poo
             if len(d.get("items",[])) < 4:
                 it = dict(pool.pop(0))
                 it["start"], it["end"] = ("11:00","13:00") if miss=="food" else ("14:00","16:00")
-                it["blurb"] = await wiki_summary(it["name"])
-                d["items"].append(it)
+                d["items"].append(it); added.append(it)
                 break
+    await asyncio.gather(*(_fill_blurb(it) for it in added))
     return days
 
 # ---------------- Build plan ----------------
-async def build_plan(city, dates, interests, wiki_sights, by_interest, show_debug=False):
+async def build_plan(city, dates, interests, wiki_sights, by_interest, show_debug=False, on_day=None):
+    # on_day(day) is called as each day finishes, before global coverage is enforced
+    # Interests are normalized once here and passed down (pools are keyed the same way)
+    interests_lc = tuple(i.lower() for i in interests)
+    interests_set = frozenset(interests_lc)
     # Pools we can pull from for enforcement/fallback
-    pools_by_interest = {k: _dedupe_by_name(v)[:] for k, v in by_interest.items()}
+    pools_by_interest = {k.lower(): _dedupe_by_name(v)[:] for k, v in by_interest.items()}
     for k in pools_by_interest:
         pools_by_interest[k] = _filter_chains(pools_by_interest[k], keep_at_least=10)
     sights_pool = _dedupe_by_name([p for p in wiki_sights if (p.get("category") or "sight")!="food"])[:60]
 
-    days_out, debug_msgs = [], []
-
-    for i, d in enumerate(dates):
-        if i > 0:
-            await asyncio.sleep(1.8)  # gentle on RPM
-        # Candidates = a few from each interest + some sights
-        cand = []
-        for it in interests:
-            cand += pools_by_interest.get(it, [])[:6]
-        cand += sights_pool[:10]
-        cand = _dedupe_by_name(cand)[:18]
-
-        obj, err = await plan_one_day(city, d, interests, cand, show_debug=show_debug)
-        if obj:
-            obj = await enforce_daily_mix(obj, interests, pools_by_interest, sights_pool)
-            days_out.append({"date": obj["date"], "items": obj["items"]})
-        else:
+    # Days are planned concurrently; the semaphore keeps us within Tier-1 RPM
+    # (429s are still handled by _stream_openai's Retry-After backoff)
+    sem = asyncio.Semaphore(DAY_CONCURRENCY)
+
+    async def _one(d):
+        day, err = await _plan_day(d)
+        if on_day: on_day(day)
+        return day, err
+
+    async def _plan_day(d):
+        async with sem:
+            # Candidates = a few from each interest + some sights
+            cand = []
+            for it in interests_lc:
+                cand += pools_by_interest.get(it, [])[:6]
+            cand += sights_pool[:10]
+            cand = _dedupe_by_name(cand)[:18]
+
+            obj, err = await plan_one_day(city, d, interests_lc, cand, show_debug=show_debug)
+            if obj:
+                obj = await enforce_daily_mix(obj, interests_lc, pools_by_interest, sights_pool,
+                                              interests_set=interests_set)
+                return {"date": obj["date"], "items": obj["items"]}, None
+
             # Fallback: assemble mix (2 categories min)
             items = []
             # add one per first 2 interests if possible
-            for it in interests[:2]:
+            for it in interests_lc[:2]:
                 pool = pools_by_interest.get(it, [])
                 if pool:
                     x = dict(pool.pop(0))
                     x["start"], x["end"] = ("11:00","13:00") if it=="food" else ("09:00","11:00")
-                    x["blurb"] = await wiki_summary(x["name"])
                     items.append(x)
             # top up with sights
             for slot in [("14:00","16:00"), ("16:00","18:00")]:
@@ -369,16 +634,44 @@ async def build_plan(city, dates, interests, wiki_sights, by_interest, show_debu
                 if sights_pool:
                     s = dict(sights_pool.pop(0))
                     s["start"], s["end"] = slot
-                    s["blurb"] = await wiki_summary(s["name"])
                     items.append(s)
-            days_out.append({"date": d, "items": items})
-            if err: debug_msgs.append(err)
+            items = list(await asyncio.gather(*(_fill_blurb(x) for x in items)))
+            return {"date": d, "items": items}, err
+
+    results = await asyncio.gather(*[_one(d) for d in dates])
+    days_out = [day for day, _ in results]
+    debug_msgs = [err for _, err in results if err]
 
     # Ensure each requested interest appears at least once
-    days_out = await enforce_global_coverage(days_out, interests, pools_by_interest, sights_pool)
+    days_out = await enforce_global_coverage(days_out, interests_lc, pools_by_interest, sights_pool)
+    for d in days_out:
+        d["items"] = [_public(it) for it in d["items"]]
     totals = {"cost_low": 50*len(days_out), "cost_high": 120*len(days_out)}
     return {"days": days_out, "totals": totals}, debug_msgs
 
+# ---------------- Pipeline ----------------
+async def pipeline(city, dates, interests, show_debug=False, on_day=None, progress=None):
+    # Everything in one event loop: one connection pool, and the Wikipedia
+    # geosearch overlaps the Overpass query. Returns (None, []) if the city isn't found.
+    # progress(label) is called as each stage starts.
+    progress = progress or (lambda label: None)
+    progress("Locating destination…")
+    loc = await geocode_city(city)
+    if not loc:
+        return None, []
+    progress("Finding places…")
+    wiki_sights, by_interest = await asyncio.gather(
+        wiki_geosearch(loc["lat"], loc["lon"]),
+        gather_interest_pois(loc["lat"], loc["lon"], interests),
+    )
+    wiki_sights = _dedupe_by_name(wiki_sights)[:60]
+    # if none requested, default to sights
+    if not by_interest and wiki_sights:
+        by_interest = {"sight": wiki_sights[:20]}
+    progress("Planning with OpenAI (per day)…")
+    return await build_plan(city, dates, interests, wiki_sights, by_interest,
+                            show_debug=show_debug, on_day=on_day)
+
 # ---------------- Streamlit UI ----------------
 st.set_page_config(page_title="VoyageCraft – AI Travel Agent", page_icon="🗺️", layout="centered")
 st.title("🗺️ VoyageCraft – AI Travel Agent (Streamlit)")
@@ -393,44 +686,56 @@ end = c2.date_input("End date", dt.date(2025, 9, 5))
 interests_csv = st.text_input("Interests (comma-separated)", "history, food")
 show_debug = st.toggle("Show OpenAI debug", value=False)
 
+def _render_day(day):
+    # One markdown element per day (fewer frontend updates than ~3 calls per item)
+    links = ["https://www.google.com/maps?q=" + quote(f"{it['lat']},{it['lon']}") for it in day["items"]]
+    parts = [f"### {day['date']}"]
+    for item, link in zip(day["items"], links):
+        parts.append(f"**• {item['name']}**  `{item['start']}-{item['end']}`  _({item.get('category','sight')})_")
+        parts.append(item.get("blurb",""))
+        parts.append(f"[Open in Google Maps]({link})")
+    st.markdown("\n\n".join(parts))
+
+async def _handle():
+    # The whole button action as one coroutine: a single _run / event loop per click
+    dates = date_list(start, end)
+    interests = [s.strip().lower() for s in interests_csv.split(",") if s.strip()]
+    status = st.status("Finding places…", expanded=show_debug)
+    live = st.empty()  # days show up here as they finish
+    done_days = {}
+
+    def _show_day(day):
+        done_days[day["date"]] = day
+        with live.container():
+            for d in sorted(done_days):
+                _render_day(done_days[d])
+
+    with status:
+        plan, dbg = await pipeline(dest, dates, interests, show_debug=show_debug, on_day=_show_day,
+                                   progress=lambda label: status.update(label=label))
+        if plan is None:
+            status.update(label="Destination not found", state="error")
+            st.error("Destination not found")
+            return
+        if show_debug and dbg:
+            for line in dbg:
+                st.write(line)
+        status.update(label="Done", state="complete")
+
+    # Final plan (global coverage may have added items) replaces the live view
+    live.empty()
+    st.success("Itinerary ready!")
+    for day in plan["days"]:
+        _render_day(day)
+
+    t = plan.get("totals", {})
+    if t:
+        st.caption(f"Budget: ${t.get('cost_low','?')}–${t.get('cost_high','?')}")
+    st.download_button("Download JSON", data=orjson.dumps(plan, option=orjson.OPT_INDENT_2),
+                       file_name="itinerary.json", mime="application/json")
+
 if st.button("Plan my trip"):
     try:
-        dates = date_list(start, end)
-        interests = [s.strip().lower() for s in interests_csv.split(",") if s.strip()]
-        with st.status("Finding places…", expanded=False):
-            loc = asyncio.run(geocode_city(dest))
-            if not loc:
-                st.error("Destination not found"); st.stop()
-            wiki_sights = asyncio.run(wiki_geosearch(loc["lat"], loc["lon"]))
-            wiki_sights = _dedupe_by_name(wiki_sights)[:60]
-
-            # interest-aware POIs for each requested interest
-            by_interest = {}
-            for it in interests:
-                by_interest[it] = asyncio.run(overpass_for_interest(loc["lat"], loc["lon"], it))
-            # if none requested, default to sights
-            if not by_interest and wiki_sights:
-                by_interest = {"sight": wiki_sights[:20]}
-
-        with st.status("Planning with OpenAI (per day)…", expanded=show_debug):
-            plan, dbg = asyncio.run(build_plan(dest, dates, interests, wiki_sights, by_interest, show_debug=show_debug))
-            if show_debug and dbg:
-                for line in dbg:
-                    st.write(line)
-
-        st.success("Itinerary ready!")
-        for day in plan["days"]:
-            st.subheader(day["date"])
-            for item in day["items"]:
-                st.markdown(f"**• {item['name']}**  `{item['start']}-{item['end']}`  _({item.get('category','sight')})_")
-                st.write(item.get("blurb",""))
-                st.markdown(f"[Open in Google Maps](https://www.google.com/maps?q={item['lat']},{item['lon']})")
-
-        t = plan.get("totals", {})
-        if t:
-            st.caption(f"Budget: ${t.get('cost_low','?')}–${t.get('cost_high','?')}")
-        st.download_button("Download JSON", data=json.dumps(plan, indent=2),
-                           file_name="itinerary.json", mime="application/json")
-
+        _run(_handle())
     except Exception as e:
         st.error(f"Unexpected error: {e}")